@@ -24,8 +24,16 @@ A python library for manipulating high-res Orthomosaic TIFF image for Computer V
 """
 
 from osgeo import gdal
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
 from .utils import (
+    _COORD_RE,
+    tile_rgba,
     tile_rgb,
     tile_alpha,
     channels_to_RGBA,
@@ -34,11 +42,11 @@ from .utils import (
     delete_tiles,
 )
 from datetime import datetime
-from itertools import product
 from PIL import Image
 from tqdm import tqdm
 import numpy as np
 import pathlib
+import math
 import os
 
 __author__ = "Abhishek Singh Thakur"
@@ -58,6 +66,7 @@ class Tiler(object):
         self,
         orthomosaic_image_path=None,
         output_folderpath=".",
+        compression="LZW",
     ):
         assert not (
             orthomosaic_image_path is None
@@ -68,6 +77,8 @@ class Tiler(object):
             ".tiff",
         ], f"Image file `{orthomosaic_img_path.resolve()}` doesn't exist or invalid, Kindly provide a valid orthomosaic TIFF image file."
         try:
+            # larger GDAL block cache so compressed TIFF blocks are decoded once
+            gdal.SetConfigOption("GDAL_CACHEMAX", "1024")
             self.dataset = gdal.Open(str(orthomosaic_img_path.resolve()))
         except Exception as e:
             print(str(e))
@@ -75,26 +86,36 @@ class Tiler(object):
                 f"Invalid input. Failed to open `{orthomosaic_img_path.name}` image."
             )
         self.out = pathlib.Path(output_folderpath).resolve()
+        # GTiff COMPRESS value used for the output tiles
+        self.compression = compression
         self.channel_shape = None
         self.tiles_size = None
+        # in-memory registry of saved tile coordinates, populated during
+        # tiling so later stages never have to re-glob the output folder
+        self._saved_tiles = set()
 
-    def __generate_tile_rgba(self, channel, tile_dimensions):
-        """Internal method for multithreaded image tiler"""
-        assert channel in valid_channels, "Invalid channel detected"
-        band = self.dataset.GetRasterBand(channels_indexes[channel])
-        ch_array = np.asarray(band.ReadAsArray())
-        if self.channel_shape is None:
-            self.channel_shape = ch_array.shape
-        if self.tiles_size is None:
-            self.tiles_size = tile_dimensions
-        if channel == "a":
-            img_files = get_img_filelist(self.out)
-            tile_alpha(img_files, ch_array, self.out, pref=channel, d=tile_dimensions)
-        else:
-            tile_rgb(ch_array, self.out, pref=channel, d=tile_dimensions)
-        # cleanup
-        del band
-        del ch_array
+    def __supertile_grid(self, tile_dimensions):
+        """Internal method for calculating a block-aligned super-tile grid.
+
+        Super-tiles are aligned to both the GDAL native block size and the
+        output tile size, and capped so one (bands, S, S) chunk stays within
+        ~64 MB of working memory.
+        """
+        band = self.dataset.GetRasterBand(1)
+        block_w, block_h = band.GetBlockSize()
+        bands = self.dataset.RasterCount
+        step = (tile_dimensions * block_h) // math.gcd(tile_dimensions, block_h)
+        supertile = step * max(
+            1, int(math.sqrt((64 * 1024 * 1024) // max(1, bands)) // step)
+        )
+        # tiles only exist up to the last full multiple of the tile size
+        height = self.channel_shape[0] - self.channel_shape[0] % tile_dimensions
+        width = self.channel_shape[1] - self.channel_shape[1] % tile_dimensions
+        return [
+            (y, x, min(supertile, width - x), min(supertile, height - y))
+            for y in range(0, height, supertile)
+            for x in range(0, width, supertile)
+        ]
 
     def generate_tiles(self, tile_dimensions=256):
         """Method for generating tiles of given dimensions from a original orthomosaic TIFF image.
@@ -102,26 +123,41 @@ class Tiler(object):
         Parameters:
         tile_dimensions (int): dimension of output tiles
         """
-        print("Generating channels files. Please wait...")
-        # multithreaded tiling
-        with tqdm(total=len(valid_channels)) as pbar:
-            with ThreadPoolExecutor(max_workers=1) as ex:
-                futures = [
-                    ex.submit(self.__generate_tile_rgba, channel, tile_dimensions)
-                    for channel in valid_channels
-                ]
+        print("Generating tiles. Please wait...")
+        self.channel_shape = (self.dataset.RasterYSize, self.dataset.RasterXSize)
+        self.tiles_size = tile_dimensions
+        self._saved_tiles = set()
+        # stream the orthomosaic in block-aligned super-tiles instead of
+        # materializing whole channels in memory
+        supertiles = self.__supertile_grid(tile_dimensions)
+        # GDAL reads stay in this process; the CPU-bound tile encode of each
+        # chunk runs on worker processes, sidestepping the GIL entirely.
+        # In-flight submissions are bounded to cap queued chunk memory.
+        max_inflight = 2 * (os.cpu_count() or 1)
+        with tqdm(total=len(supertiles)) as pbar:
+            with ProcessPoolExecutor(max_workers=os.cpu_count()) as ex:
+                futures = set()
+                for yoff, xoff, win_w, win_h in supertiles:
+                    if len(futures) >= max_inflight:
+                        done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            self._saved_tiles.update(future.result())
+                            pbar.update(1)
+                    chunk = self.dataset.ReadAsArray(xoff, yoff, win_w, win_h)
+                    futures.add(
+                        ex.submit(
+                            tile_rgba,
+                            chunk,
+                            self.out,
+                            d=tile_dimensions,
+                            compression=self.compression,
+                            row_off=yoff,
+                            col_off=xoff,
+                        )
+                    )
                 for future in as_completed(futures):
-                    result = future.result()
+                    self._saved_tiles.update(future.result())
                     pbar.update(1)
-
-        img_files = get_img_filelist(self.out)
-        try:
-            print("Merging channel files...")
-            channels_to_RGBA(img_files, self.out)
-            print("Cleaning leftover files...")
-            delete_channel_files(img_files, self.out)
-        except Exception as e:
-            raise RuntimeError(str(e))
         print("Tiling operation completed successfully!!!")
 
     @property
@@ -131,6 +167,8 @@ class Tiler(object):
 
         **Returns:** list
         """
+        if self._saved_tiles:
+            return sorted(self._saved_tiles)
         return get_img_filelist(self.out)
 
     @property
@@ -169,16 +207,12 @@ class Stitcher(object):
             self.tiles_folder_path.iterdir()
         ), f"Folder {self.tiles_folder_path.resolve()} doesn't exist or empty, Kindly provide a valid orthomosaic TIFF tiles folder path."
         all_tiles = self.tiles_folder_path.glob("rgba*.tiff")
-        # extract coordinates from tiles filenames
-        self.__tiles_coor = [
-            (
-                int(os.path.basename(tile).split("_")[1]),
-                int(os.path.basename(tile).split("_")[2].split(".")[0]),
-            )
-            for tile in all_tiles
-        ]
-        # sort them
-        self.__tiles_coor.sort()
+        # map tile coordinates to their on-disk paths in one directory scan,
+        # so stitching needs neither membership scans nor path reconstruction
+        self.__tiles_path = {}
+        for tile in all_tiles:
+            m = _COORD_RE.search(os.path.basename(tile))
+            self.__tiles_path[(int(m.group(1)), int(m.group(2)))] = str(tile)
 
         # verify and extract original width and height of orthomosaic image
         assert isinstance(
@@ -199,25 +233,40 @@ class Stitcher(object):
         # calculate new width and height
         # new_width = org_w - org_w % tiles_size
         # new_height = org_h - org_w % tiles_size
-        # create new blank RGBA image with new width and height
-        self.new_ortho_image = Image.new("RGBA", (org_w, org_h))
+        # the blank RGBA canvas is allocated lazily on first stitch() call:
+        # eager allocation here would pin H*W*4 bytes (10 GB on a 50k ortho)
+        # even when the user only wants metadata
+        self.canvas = None
+        self.__canvas_shape = (org_h, org_w, 4)
 
         # calculate orthomosaic image grid
-        self.orthomosaic_grid = product(
-            range(0, org_h - org_h % tiles_size, tiles_size),
-            range(0, org_w - org_w % tiles_size, tiles_size),
-        )
+        # (a concrete list, not a generator: product() is single-use and a
+        # second stitch() call would otherwise silently do nothing)
+        self.orthomosaic_grid = [
+            (i, j)
+            for i in range(0, org_h - org_h % tiles_size, tiles_size)
+            for j in range(0, org_w - org_w % tiles_size, tiles_size)
+        ]
+
+    def __ensure_canvas(self):
+        """Internal method that allocates the output canvas on first use.
+
+        NumPy array canvas so tiles are blitted with plain slice assignment
+        instead of PIL paste and its alpha-compositing path.
+        """
+        if self.canvas is None:
+            self.canvas = np.zeros(self.__canvas_shape, dtype=np.uint8)
 
     def __stitch_tiles(self, tile_coordinate):
         """Internal method for multithreaded image tiler"""
-        assert not tile_coordinate is None, "Invalid tile coordinates"
+        tile_path = self.__tiles_path.get(tile_coordinate)
+        if tile_path is None:
+            # gap tile: no data was saved for this grid cell
+            return
         (i, j) = tile_coordinate
-        if (i, j) in self.__tiles_coor:
-            tile_image = Image.open(
-                os.path.join(self.tiles_folder_path, f"rgba_{i}_{j}.tiff")
-            )
-            box = (j, i, j + self.tiles_size, i + self.tiles_size)
-            self.new_ortho_image.paste(tile_image, box)
+        self.canvas[i : i + self.tiles_size, j : j + self.tiles_size] = np.asarray(
+            Image.open(tile_path)
+        )
 
     def stitch(self, extension=".png", cleanup_tiles=False):
         """Method for stitching multiple tiles into a original orthomosaic image.
@@ -227,23 +276,22 @@ class Stitcher(object):
         cleanup_tiles (bool): Cleanup tiles after stitching?
         """
         print("Stitching tiles. Please wait...")
-        # multithreaded stitching
-        with tqdm(total=len(valid_channels)) as pbar:
-            with ThreadPoolExecutor(max_workers=1) as ex:
-                futures = [
-                    ex.submit(self.__stitch_tiles, tile_coor)
-                    for tile_coor in self.orthomosaic_grid
-                ]
-                for future in as_completed(futures):
-                    result = future.result()
-                    pbar.update(1)
+        self.__ensure_canvas()
+        # multithreaded stitching: executor.map with chunksize amortizes
+        # task-dispatch overhead instead of allocating one Future per tile
+        with ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1)) as ex:
+            for _ in tqdm(
+                ex.map(self.__stitch_tiles, self.orthomosaic_grid, chunksize=64),
+                total=len(self.orthomosaic_grid),
+            ):
+                pass
         try:
             time_str = datetime.now().strftime("%Y_%m_%d-%I_%M_%S_%p")
             save_path = os.path.join(
                 self.tiles_folder_path, f"{time_str}_rgba{extension}"
             )
             print(f"Saving orthomosaic file at {save_path}...")
-            self.new_ortho_image.save(save_path, compress_level=1)
+            Image.fromarray(self.canvas, "RGBA").save(save_path, compress_level=1)
             if cleanup_tiles:
                 print("Cleaning leftover files...")
                 tiles_paths = get_img_filelist(self.tiles_folder_path, pattern="rgba_*")
@@ -251,7 +299,7 @@ class Stitcher(object):
                     tiles_paths,
                     self.tiles_folder_path,
                 )
-                del self.new_ortho_image
+                self.canvas = None
         except Exception as e:
             raise RuntimeError(str(e))
         print("Stitching operation completed successfully!!!")
@@ -18,54 +18,181 @@ limitations under the License.
 ===============================================
 """
 
-from PIL import Image, ImageChops
+from osgeo import gdal
+from PIL import Image
 from itertools import product
+import numpy as np
 import os
-import sys
+import re
 import glob
-import pathlib
+
+# precompiled pattern for extracting (row, col) coordinates from tile
+# filenames like `rgba_512_768.tiff`
+_COORD_RE = re.compile(r"_(\d+)_(\d+)\.")
+
+# Numba is optional: when available, the tile-emptiness check is JIT-compiled
+# and classifies all tiles of a chunk in one parallel pass
+try:
+    from numba import njit, prange
+
+    _HAVE_NUMBA = True
+except ImportError:
+    _HAVE_NUMBA = False
+
+if _HAVE_NUMBA:
+
+    @njit(parallel=True, cache=True, nogil=True)
+    def _tile_any_mask(arr, d, blank):
+        nh, nw = arr.shape[0] // d, arr.shape[1] // d
+        out = np.zeros((nh, nw), np.bool_)
+        for ti in prange(nh):
+            for tj in range(nw):
+                found = False
+                for y in range(ti * d, ti * d + d):
+                    for x in range(tj * d, tj * d + d):
+                        # early exit: real tiles hit a non-blank pixel almost
+                        # immediately, collapsing the scan from d*d loads to ~1
+                        if arr[y, x] != blank:
+                            found = True
+                            break
+                    if found:
+                        break
+                out[ti, tj] = found
+        return out
+
+else:
+    _tile_any_mask = None
+
+
+def _tile_gate(arr, d, blank=0):
+    # single reshape-and-reduce sweep producing the whole (nh, nw) boolean
+    # gate of non-blank tiles, instead of one small reduction per tile
+    h2, w2 = arr.shape[0] - arr.shape[0] % d, arr.shape[1] - arr.shape[1] % d
+    view = arr[:h2, :w2].reshape(h2 // d, d, w2 // d, d)
+    return (view != blank).any(axis=(1, 3))
+
+
+def _nonblank_mask(arr, d, blank):
+    if _HAVE_NUMBA:
+        return _tile_any_mask(arr, d, blank)
+    return _tile_gate(arr, d, blank)
 
 
 def get_img_filelist(dir_out, pattern="r*.tiff"):
-    image_paths = glob.glob(os.path.join(dir_out, pattern))
-    image_paths = [
-        (
-            int(os.path.basename(image).split("_")[1]),
-            int(os.path.basename(image).split("_")[2].split(".")[0]),
-        )
-        for image in image_paths
-    ]
+    image_paths = []
+    for image in glob.glob(os.path.join(dir_out, pattern)):
+        m = _COORD_RE.search(os.path.basename(image))
+        image_paths.append((int(m.group(1)), int(m.group(2))))
     image_paths.sort()
     return image_paths
 
 
-def tile_rgb(arr, dir_out, d=256, pref="", ext=".tiff", compression=None, quality=100):
-    img = Image.fromarray(arr)
-    w, h = img.size
+def _channel_to_image(sub):
+    # zero-copy PIL wrapper over the tile buffer (Image.fromarray copies it)
+    if not sub.flags["C_CONTIGUOUS"]:
+        sub = np.ascontiguousarray(sub)
+    return Image.frombuffer("L", sub.shape[::-1], sub, "raw", "L", 0, 1)
+
+
+def tile_rgb(
+    arr,
+    dir_out,
+    d=256,
+    pref="",
+    ext=".tiff",
+    compression="tiff_lzw",
+    row_off=0,
+    col_off=0,
+    saved_coords=None,
+):
+    """Legacy per-channel tiler, superseded by the fused `tile_rgba`."""
+    h, w = arr.shape
+    # gate that skips all-white (empty) tiles
+    mask = _nonblank_mask(arr, d, 255)
     grid = product(range(0, h - h % d, d), range(0, w - w % d, d))
     for i, j in grid:
-        box = (j, i, j + d, i + d)
-        out = os.path.join(dir_out, f"{pref}_{i}_{j}{ext}")
-        cropped = img.crop(box)
-        if ImageChops.invert(cropped).getbbox():
-            cropped.save(out, compression=compression, quality=quality)
+        if mask[i // d, j // d]:
+            _channel_to_image(arr[i : i + d, j : j + d]).save(
+                os.path.join(dir_out, f"{pref}_{row_off + i}_{col_off + j}{ext}"),
+                format="TIFF",
+                compression=compression,
+            )
+            if saved_coords is not None:
+                saved_coords.add((row_off + i, col_off + j))
+    return saved_coords
+
+
+def tile_rgba(
+    arr4,
+    dir_out,
+    d=256,
+    pref="rgba",
+    ext=".tiff",
+    compression="LZW",
+    row_off=0,
+    col_off=0,
+):
+    h, w = arr4.shape[1:]
+    # gate that skips tiles with no real data (fully transparent alpha)
+    mask = _nonblank_mask(arr4[3], d, 0)
+    grid = product(range(0, h - h % d, d), range(0, w - w % d, d))
+    saved_coords = set()
+    # libtiff LZW through GDAL encodes faster than PIL's TIFF writer and
+    # shrinks natural-imagery tiles ~2-3x versus the old raw output
+    driver = gdal.GetDriverByName("GTiff")
+    options = [
+        f"COMPRESS={compression}",
+        "TILED=YES",
+        "BLOCKXSIZE=256",
+        "BLOCKYSIZE=256",
+        "NUM_THREADS=ALL_CPUS",
+    ]
+    for i, j in grid:
+        if mask[i // d, j // d]:
+            # one contiguous (4, d, d) SoA subblock straight from the chunk;
+            # WriteArray consumes it directly, no intermediate byte string
+            sub = np.ascontiguousarray(arr4[:, i : i + d, j : j + d])
+            tile_ds = driver.Create(
+                os.path.join(dir_out, f"{pref}_{row_off + i}_{col_off + j}{ext}"),
+                d,
+                d,
+                4,
+                gdal.GDT_Byte,
+                options=options,
+            )
+            tile_ds.WriteArray(sub)
+            tile_ds = None
+            saved_coords.add((row_off + i, col_off + j))
+    return saved_coords
 
 
 def tile_alpha(
-    img_files, arr, dir_out, d=256, pref="", ext=".tiff", compression=None, quality=100
+    img_files,
+    arr,
+    dir_out,
+    d=256,
+    pref="",
+    ext=".tiff",
+    compression="tiff_lzw",
+    row_off=0,
+    col_off=0,
 ):
-    img = Image.fromarray(arr)
-    w, h = img.size
+    """Legacy alpha-channel tiler, superseded by the alpha gate in `tile_rgba`."""
+    # O(1) membership lookups instead of scanning the coordinates list per tile
+    img_files = set(img_files)
+    h, w = arr.shape
     grid = product(range(0, h - h % d, d), range(0, w - w % d, d))
     for i, j in grid:
-        box = (j, i, j + d, i + d)
-        out = os.path.join(dir_out, f"{pref}_{i}_{j}{ext}")
-        cropped = img.crop(box)
-        if (i, j) in img_files:
-            cropped.save(out, compression=compression, quality=quality)
+        if (row_off + i, col_off + j) in img_files:
+            _channel_to_image(arr[i : i + d, j : j + d]).save(
+                os.path.join(dir_out, f"{pref}_{row_off + i}_{col_off + j}{ext}"),
+                format="TIFF",
+                compression=compression,
+            )
 
 
-def channels_to_RGBA(img_files, dir_out, ext=".tiff", compression=None, quality=100):
+def channels_to_RGBA(img_files, dir_out, ext=".tiff", compression="tiff_lzw"):
+    """Legacy channel merger, unnecessary with the fused `tile_rgba` path."""
     for i, j in img_files:
         r = Image.open(os.path.join(dir_out, f"r_{i}_{j}{ext}"))
         g = Image.open(os.path.join(dir_out, f"g_{i}_{j}{ext}"))
@@ -74,30 +201,28 @@ def channels_to_RGBA(img_files, dir_out, ext=".tiff", compression=None, quality=
         rgb = Image.merge("RGBA", (r, g, b, a))
         rgb.save(
             os.path.join(dir_out, f"rgba_{i}_{j}{ext}"),
+            format="TIFF",
             compression=compression,
-            quality=quality,
         )
 
 
 def delete_file_safe(file_path):
+    # plain os.unlink: no pathlib.Path wrapper allocation per file
     try:
-        dfile = pathlib.Path(file_path)
-        if sys.version_info >= (3, 8, 0):
-            dfile.unlink(missing_ok=True)
-        else:
-            dfile.exists() and dfile.unlink()
-    except Exception as e:
+        os.unlink(file_path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
         print(str(e))
 
 
 def delete_tiles(img_files, dir_out, ext=".tiff"):
     for i, j in img_files:
-        delete_file_safe(os.path.join(dir_out, f"rgba_{i}_{j}{ext}"))
+        delete_file_safe(f"{dir_out}{os.sep}rgba_{i}_{j}{ext}")
 
 
 def delete_channel_files(img_files, dir_out, ext=".tiff"):
+    """Legacy cleanup of per-channel intermediates, unnecessary with `tile_rgba`."""
     for i, j in img_files:
-        delete_file_safe(os.path.join(dir_out, f"r_{i}_{j}{ext}"))
-        delete_file_safe(os.path.join(dir_out, f"g_{i}_{j}{ext}"))
-        delete_file_safe(os.path.join(dir_out, f"b_{i}_{j}{ext}"))
-        delete_file_safe(os.path.join(dir_out, f"a_{i}_{j}{ext}"))
+        for channel in ("r", "g", "b", "a"):
+            delete_file_safe(f"{dir_out}{os.sep}{channel}_{i}_{j}{ext}")